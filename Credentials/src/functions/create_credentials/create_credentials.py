@@ -2,8 +2,7 @@ import json
 import logging
 import os
 
-import boto3
-from botocore.vendored import requests
+from aws_clients import aws_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -28,6 +27,8 @@ def send_cf_response(event, context, success=True, reason='Unknown'):
         'Content-Type': ''
     }
 
+    from botocore.vendored import requests
+
     logger.info(f"Sending CloudFormation response to {event['ResponseURL']}")
     resp = requests.put(
         event['ResponseURL'],
@@ -66,7 +67,7 @@ def delete(client):
 
 def lambda_handler(event, context):
     logger.info(event)
-    client = boto3.client('ssm')
+    client = aws_client('ssm')
 
     if event['RequestType'] == 'Create':
         action = create
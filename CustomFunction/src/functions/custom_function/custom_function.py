@@ -0,0 +1,257 @@
+"""Invoke other Lambda functions with Jamf Pro webhook or Poller events."""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import uuid
+
+from aws_clients import aws_client
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.getenv('BUCKET_NAME')
+QUEUE_URL = os.getenv('QUEUE_URL')
+DEAD_LETTER_QUEUE_URL = os.getenv('DEAD_LETTER_QUEUE_URL')
+TARGET_FUNCTIONS = [
+    name.strip() for name in os.getenv('TARGET_FUNCTIONS', '').split(',')
+    if name.strip()
+]
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '10'))
+MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', '5'))
+
+# The payload limit for asynchronous (``Event``) invocations
+MAX_PAYLOAD_SIZE = 256 * 1024
+
+# Message attributes used to retry an event for only the targets that failed
+TARGETS_ATTRIBUTE = 'voltron_targets'
+ATTEMPT_ATTRIBUTE = 'voltron_attempt'
+
+
+_payload_prefix = b'{"events": ['
+_payload_suffix = b']}'
+
+Message = namedtuple('Message', ['message_id', 'body', 'targets', 'attempt'])
+
+
+def _attribute(record, name):
+    return (record.get('messageAttributes') or {}).get(name, {}) \
+        .get('stringValue')
+
+
+def read_message(record):
+    """Return the event of an SQS record from the source topic, or ``None``
+    if it is not JSON.
+
+    Records re-queued by :func:`retry_message` carry the targets that are
+    still to be invoked and the attempt number.
+
+    :param dict record: An SQS record from a raw SNS subscription.
+
+    :rtype: Message or None
+    """
+    try:
+        body = record['body']
+        json.loads(body)
+    except (KeyError, TypeError, json.JSONDecodeError):
+        logger.exception('Bad Request: No JSON content found')
+        return None
+
+    targets = _attribute(record, TARGETS_ATTRIBUTE)
+    targets = targets.split(',') if targets else TARGET_FUNCTIONS
+    attempt = int(_attribute(record, ATTEMPT_ATTRIBUTE) or 1)
+    return Message(record['messageId'], body.encode(), targets, attempt)
+
+
+def offload_event(message):
+    """Write an event that is too large to invoke a function with to S3 and
+    return a pointer to it in its place.
+
+    :param bytes message: The encoded event.
+
+    :returns: Encoded ``s3Pointer`` message.
+    :rtype: bytes
+    """
+    key = f'payloads/{uuid.uuid4()}.json'
+    client = aws_client('s3')
+    from botocore.exceptions import ClientError
+
+    try:
+        client.put_object(
+            Bucket=BUCKET_NAME,
+            Key=key,
+            Body=message,
+            ContentType='application/json'
+        )
+    except ClientError:
+        logger.exception('Unable to offload event payload to S3')
+        raise
+
+    logger.info(f'Offloaded {len(message)} byte event to '
+                f's3://{BUCKET_NAME}/{key}')
+    return json.dumps(
+        {'s3Pointer': {'bucket': BUCKET_NAME, 'key': key}}).encode()
+
+
+def batch_events(messages):
+    """Group messages into batches whose payloads fit within the
+    asynchronous invocation limit.
+
+    Messages must already be small enough to fit in a payload on their own
+    (see :func:`offload_event`).
+
+    :param list messages: :class:`Message` objects.
+
+    :returns: Lists of messages.
+    :rtype: list
+    """
+    overhead = len(_payload_prefix) + len(_payload_suffix)
+    batches = list()
+    batch = list()
+    batch_size = overhead
+
+    for message in messages:
+        # Account for the separating comma
+        if batch and batch_size + len(message.body) + 1 > MAX_PAYLOAD_SIZE:
+            batches.append(batch)
+            batch = list()
+            batch_size = overhead
+
+        batch_size += len(message.body) + (1 if batch else 0)
+        batch.append(message)
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def encode_payload(batch):
+    """Return the payload target functions are invoked with:
+    ``{"events": [...]}`` where each item is either the original event or
+    ``{"s3Pointer": {"bucket": ..., "key": ...}}``.
+    """
+    return _payload_prefix + b','.join(m.body for m in batch) + \
+        _payload_suffix
+
+
+def invoke_function(client, function_name, payload):
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    # Connection errors and timeouts are a failure of this target only, so
+    # they must not fail the batch for the targets that were invoked
+    try:
+        client.invoke(
+            FunctionName=function_name,
+            InvocationType='Event',
+            Payload=payload
+        )
+    except (BotoCoreError, ClientError):
+        logger.exception(f'Unable to invoke function: {function_name}')
+        return False
+
+    return True
+
+
+def retry_message(client, message, failed_targets):
+    """Queue an event again for only the targets that failed, with an
+    increasing delay, or move it to the dead-letter queue after
+    ``MAX_ATTEMPTS``.
+
+    :returns: ``False`` if the message could not be queued.
+    :rtype: bool
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    attempt = message.attempt + 1
+    if attempt > MAX_ATTEMPTS:
+        queue_url = DEAD_LETTER_QUEUE_URL
+        delay = 0
+        logger.error(f'Giving up on message {message.message_id} for: '
+                     f"{', '.join(failed_targets)}")
+    else:
+        queue_url = QUEUE_URL
+        delay = min(900, 30 * 2 ** message.attempt)
+
+    try:
+        client.send_message(
+            QueueUrl=queue_url,
+            MessageBody=message.body.decode(),
+            DelaySeconds=delay,
+            MessageAttributes={
+                TARGETS_ATTRIBUTE: {
+                    'DataType': 'String',
+                    'StringValue': ','.join(sorted(failed_targets))
+                },
+                ATTEMPT_ATTRIBUTE: {
+                    'DataType': 'Number',
+                    'StringValue': str(attempt)
+                }
+            }
+        )
+    except (BotoCoreError, ClientError):
+        logger.exception(f'Unable to queue message {message.message_id}')
+        return False
+
+    return True
+
+
+def lambda_handler(event, context):
+    """Invokes each target function asynchronously with batches of the
+    queued events. Invocations are made in parallel.
+
+    An event whose invocation failed for some targets is queued again for
+    only those targets, so targets that succeeded do not receive it twice.
+    If that is not possible the event is returned in ``batchItemFailures``
+    and retried for every target.
+    """
+    messages = list()
+    for record in event.get('Records', []):
+        message = read_message(record)
+        if message:
+            messages.append(message)
+
+    if not messages or not TARGET_FUNCTIONS:
+        return {'batchItemFailures': []}
+
+    overhead = len(_payload_prefix) + len(_payload_suffix)
+    messages = [
+        message._replace(body=offload_event(message.body))
+        if len(message.body) + overhead > MAX_PAYLOAD_SIZE else message
+        for message in messages
+    ]
+
+    jobs = list()
+    for function_name in TARGET_FUNCTIONS:
+        for batch in batch_events(
+                [m for m in messages if function_name in m.targets]):
+            jobs.append((function_name, batch))
+
+    logger.info(f'Invoking {len(TARGET_FUNCTIONS)} function(s) with '
+                f'{len(messages)} event(s) in {len(jobs)} invocation(s)')
+
+    client = aws_client('lambda')
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(
+            lambda job: invoke_function(
+                client, job[0], encode_payload(job[1])),
+            jobs
+        ))
+
+    failed_targets = dict()
+    for (function_name, batch), success in zip(jobs, results):
+        if not success:
+            for message in batch:
+                failed_targets.setdefault(
+                    message.message_id, set()).add(function_name)
+
+    batch_item_failures = list()
+    sqs_client = aws_client('sqs') if failed_targets else None
+    for message in messages:
+        targets = failed_targets.get(message.message_id)
+        if targets and not retry_message(sqs_client, message, targets):
+            batch_item_failures.append(
+                {'itemIdentifier': message.message_id})
+
+    return {'batchItemFailures': batch_item_failures}
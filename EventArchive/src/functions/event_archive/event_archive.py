@@ -0,0 +1,126 @@
+"""Archive Jamf Pro webhook events to S3 as compressed newline-JSON."""
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+from aws_clients import aws_client
+from jamf_events import WebhookEvent
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.getenv('BUCKET_NAME')
+
+# Message attribute set on events published by ``replay.py`` so that they are
+# not archived a second time
+REPLAY_ATTRIBUTE = 'voltron_replay'
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def partition_prefix(timestamp):
+    """Return the key prefix for the hourly partition of a timestamp.
+
+    :param datetime timestamp: A UTC timestamp.
+
+    :rtype: str
+    """
+    return timestamp.strftime('events/year=%Y/month=%m/day=%d/hour=%H/')
+
+
+def archive_line(record):
+    """Return an archive line for an SQS record or ``None`` if the record
+    should not be archived.
+
+    :param dict record: An SQS record from a raw SNS subscription.
+
+    :returns: The event timestamp and encoded line.
+    :rtype: tuple or None
+    """
+    if REPLAY_ATTRIBUTE in record.get('messageAttributes', {}):
+        return None
+
+    try:
+        message = json.loads(record['body'])
+        webhook_event = WebhookEvent.from_message(message)
+    except (KeyError, TypeError, json.JSONDecodeError):
+        logger.exception('Bad Request: No webhook event found')
+        return None
+
+    timestamp = datetime.utcfromtimestamp(
+        int(record['attributes']['SentTimestamp']) / 1000)
+
+    line = json.dumps({
+        'timestamp': timestamp.strftime(TIMESTAMP_FORMAT),
+        'eventType': webhook_event.event_type,
+        'message': message
+    })
+    return timestamp, line + '\n'
+
+
+def partition_key(prefix, timestamp, message_ids):
+    """Return the key of an archive object.
+
+    The key is derived from the IDs of the messages it holds, so writing the
+    same messages again when SQS redelivers them replaces the object instead
+    of duplicating the events.
+    """
+    digest = hashlib.sha1(
+        ','.join(sorted(message_ids)).encode()).hexdigest()[:16]
+    return f"{prefix}{timestamp.strftime('%Y%m%dT%H%M%SZ')}-{digest}.json.gz"
+
+
+def write_partition(client, key, lines):
+    """Write the lines of one partition to S3, sorted by time (each line
+    starts with its timestamp).
+
+    :returns: ``False`` if the write failed.
+    :rtype: bool
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        client.put_object(
+            Bucket=BUCKET_NAME,
+            Key=key,
+            Body=gzip.compress(''.join(sorted(lines)).encode()),
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip'
+        )
+    except ClientError:
+        logger.exception(f'Unable to write archive object: {key}')
+        return False
+
+    return True
+
+
+def lambda_handler(event, context):
+    """Writes a batch of events from the archive queue into one gzip
+    compressed newline-JSON object per hourly partition.
+
+    If the write of a partition fails only its messages are returned in
+    ``batchItemFailures`` to be retried.
+    """
+    partitions = dict()
+    for record in event.get('Records', []):
+        result = archive_line(record)
+        if result:
+            timestamp, line = result
+            partition = partitions.setdefault(
+                partition_prefix(timestamp), [timestamp, list(), list()])
+            partition[0] = min(partition[0], timestamp)
+            partition[1].append(line)
+            partition[2].append(record['messageId'])
+
+    client = aws_client('s3') if partitions else None
+    batch_item_failures = list()
+    for prefix, (timestamp, lines, message_ids) in partitions.items():
+        key = partition_key(prefix, timestamp, message_ids)
+        logger.info(f'Archiving {len(lines)} event(s) to {key}')
+        if not write_partition(client, key, lines):
+            batch_item_failures.extend(
+                {'itemIdentifier': message_id} for message_id in message_ids)
+
+    return {'batchItemFailures': batch_item_failures}
@@ -0,0 +1,211 @@
+"""Replay archived Jamf Pro webhook events into an SNS topic.
+
+Run locally with credentials for the account::
+
+    python replay.py --bucket <archive bucket> --topic <topic arn> \\
+        --start 2018-09-01T00:00:00 --end 2018-09-02T00:00:00 \\
+        --event-type ComputerAdded --rate 10
+"""
+import argparse
+from datetime import datetime, timedelta
+import gzip
+import heapq
+import json
+import logging
+import time
+
+import boto3
+
+from event_archive import REPLAY_ATTRIBUTE, TIMESTAMP_FORMAT, partition_prefix
+
+logger = logging.getLogger(__name__)
+
+# The maximum number of entries and total size of an SNS ``PublishBatch``
+# request (messages and their attributes)
+MAX_BATCH_SIZE = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+def parse_timestamp(value):
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value.rstrip('Z'), fmt)
+        except ValueError:
+            continue
+
+    raise argparse.ArgumentTypeError(f'Invalid UTC timestamp: {value}')
+
+
+def positive_rate(value):
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = 0
+
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(
+            f'Rate must be a number greater than 0: {value}')
+    return rate
+
+
+def _read_archive(client, bucket, key):
+    """Return the events of an archive object.
+
+    An object holds at most one batch of the archive function, so it is read
+    in full rather than keeping its connection open while events are
+    replayed.
+
+    :rtype: list
+    """
+    body = client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    return [json.loads(line)
+            for line in gzip.decompress(body).decode().splitlines() if line]
+
+
+def archived_events(client, bucket, start, end, event_types=None):
+    """Yield archived events between ``start`` and ``end`` in time order.
+
+    Objects in the same hour can overlap in time, so the objects of an hour
+    are read and then merged (each object is sorted by time when it is
+    written).
+
+    :param client: A boto3 S3 client.
+    :param str bucket: The archive bucket.
+    :param datetime start: Inclusive UTC start time.
+    :param datetime end: Exclusive UTC end time.
+    :param set event_types: Optional webhook event types to filter by.
+    """
+    start_str = start.strftime(TIMESTAMP_FORMAT)
+    end_str = end.strftime(TIMESTAMP_FORMAT)
+    paginator = client.get_paginator('list_objects_v2')
+
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        keys = [
+            obj['Key']
+            for page in paginator.paginate(
+                Bucket=bucket, Prefix=partition_prefix(hour))
+            for obj in page.get('Contents', [])
+        ]
+
+        for archived in heapq.merge(
+                *[_read_archive(client, bucket, key) for key in keys],
+                key=lambda archived: archived['timestamp']):
+            if not start_str <= archived['timestamp'] < end_str:
+                continue
+            if event_types and archived['eventType'] not in event_types:
+                continue
+            yield archived
+
+        hour += timedelta(hours=1)
+
+
+def _batch_entry(archived):
+    return {
+        'Message': json.dumps(archived['message']),
+        'MessageAttributes': {
+            REPLAY_ATTRIBUTE: {
+                'DataType': 'String',
+                'StringValue': 'true'
+            },
+            'webhookEvent': {
+                'DataType': 'String',
+                'StringValue': archived['eventType']
+            }
+        }
+    }
+
+
+def _entry_size(entry):
+    """Return the size SNS counts towards the batch limit for an entry."""
+    return len(entry['Message'].encode()) + sum(
+        len(name.encode()) + len(value['DataType'].encode()) +
+        len(value['StringValue'].encode())
+        for name, value in entry['MessageAttributes'].items()
+    )
+
+
+def replay(events, client, topic_arn, rate):
+    """Publish archived events to an SNS topic at no more than ``rate``
+    messages per second.
+
+    Messages are published with the same ``webhookEvent`` attribute as the
+    Webhook Receiver sets so subscription filter policies still apply.
+
+    :returns: The number of messages published.
+    :rtype: int
+    """
+    batch_size = max(1, min(MAX_BATCH_SIZE, int(rate)))
+    interval = 1.0 / rate
+    next_publish = time.monotonic()
+    published = 0
+
+    def _publish(batch):
+        nonlocal next_publish, published
+        delay = next_publish - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        resp = client.publish_batch(
+            TopicArn=topic_arn,
+            PublishBatchRequestEntries=[
+                dict(entry, Id=str(index))
+                for index, (entry, _) in enumerate(batch)
+            ]
+        )
+        for failed in resp.get('Failed', []):
+            logger.error(f"Unable to publish event: {failed['Message']}")
+
+        next_publish = max(next_publish, time.monotonic()) + \
+            len(batch) * interval
+        published += len(resp.get('Successful', []))
+
+    batch = list()
+    batch_bytes = 0
+    for archived in events:
+        entry = _batch_entry(archived)
+        size = _entry_size(entry)
+        # An event too large to share a batch is published on its own
+        if batch and (len(batch) == batch_size or
+                      batch_bytes + size > MAX_BATCH_BYTES):
+            _publish(batch)
+            batch = list()
+            batch_bytes = 0
+
+        batch.append((entry, size))
+        batch_bytes += size
+
+    if batch:
+        _publish(batch)
+
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bucket', required=True,
+                        help='The Event Archive bucket name.')
+    parser.add_argument('--topic', required=True,
+                        help='The ARN of the SNS topic to publish to.')
+    parser.add_argument('--start', required=True, type=parse_timestamp,
+                        help='Inclusive UTC start time (YYYY-MM-DDTHH:MM:SS).')
+    parser.add_argument('--end', required=True, type=parse_timestamp,
+                        help='Exclusive UTC end time (YYYY-MM-DDTHH:MM:SS).')
+    parser.add_argument('--event-type', action='append', dest='event_types',
+                        help='Only replay this webhook event type. '
+                             'Can be passed multiple times.')
+    parser.add_argument('--rate', type=positive_rate, default=10.0,
+                        help='Maximum events published per second.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    events = archived_events(
+        boto3.client('s3'), args.bucket, args.start, args.end,
+        set(args.event_types) if args.event_types else None
+    )
+    published = replay(events, boto3.client('sns'), args.topic, args.rate)
+    logger.info(f'Replayed {published} event(s) to {args.topic}')
+
+
+if __name__ == '__main__':
+    main()
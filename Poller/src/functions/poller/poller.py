@@ -2,30 +2,40 @@ import json
 import logging
 import os
 
-import boto3
-from botocore.exceptions import ClientError
-from botocore.vendored import requests
+from aws_clients import aws_client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-if not (os.getenv('JSS_USERNAME') and os.getenv('JSS_PASSWORD')):
-    raise Exception('Jamf Pro credentials are required for Poller operation')
+REQUIRED_ENV = ('POLLER_TOPIC', 'JSS_USERNAME', 'JSS_PASSWORD', 'JSS_DOMAIN',
+                'JSS_ENDPOINT', 'JSS_OBJECT_ID')
 
 POLLER_TOPIC = os.getenv('POLLER_TOPIC')
-URL = 'https://' + os.path.join(
-    os.getenv('JSS_DOMAIN'),
-    'JSSResource',
-    os.getenv('JSS_ENDPOINT'),
-    'id',
-    os.getenv('JSS_OBJECT_ID')
-)
 
 
-def poll_jamf_pro():
+def check_config():
+    missing = [name for name in REQUIRED_ENV if not os.getenv(name)]
+    if missing:
+        raise Exception('Missing environment variables required for Poller '
+                        f"operation: {', '.join(missing)}")
+
+
+def api_url():
+    return 'https://' + os.path.join(
+        os.getenv('JSS_DOMAIN'),
+        'JSSResource',
+        os.getenv('JSS_ENDPOINT'),
+        'id',
+        os.getenv('JSS_OBJECT_ID')
+    )
+
+
+def poll_jamf_pro(url):
+    from botocore.vendored import requests
+
     try:
         resp = requests.get(
-            URL,
+            url,
             headers={'Accept': 'application/json'},
             auth=(os.getenv('JSS_USERNAME'), os.getenv('JSS_PASSWORD')),
             timeout=90
@@ -43,7 +53,8 @@ def poll_jamf_pro():
 
 
 def publish_data(data):
-    sns_client = boto3.client('sns')
+    sns_client = aws_client('sns')
+    from botocore.exceptions import ClientError
 
     try:
         resp = sns_client.publish(
@@ -57,8 +68,11 @@ def publish_data(data):
 
 
 def lambda_handler(event, context):
-    logger.info(f'Requesting data for: {URL}')
-    api_data = poll_jamf_pro()
+    check_config()
+    url = api_url()
+
+    logger.info(f'Requesting data for: {url}')
+    api_data = poll_jamf_pro(url)
 
     logger.info('Publishing response to SNS topic...')
     publish_data(api_data)
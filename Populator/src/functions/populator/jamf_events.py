@@ -0,0 +1 @@
+../../../../shared/jamf_events.py
\ No newline at end of file
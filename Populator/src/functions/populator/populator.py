@@ -1,28 +1,21 @@
 import json
 import logging
 import os
-from xml.etree import ElementTree as ET
 
-import boto3
-from botocore.exceptions import ClientError
-from botocore.vendored import requests
+from aws_clients import aws_client
+from jamf_events import WebhookEvent
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-if not (os.getenv('JSS_USERNAME') and os.getenv('JSS_PASSWORD')):
-    raise Exception('Jamf Pro credentials are required for Populator operation')
+SUPPORTED_EVENTS = ('ComputerAdded', 'MobileDeviceEnrolled')
+
+REQUIRED_ENV = ('BUCKET_NAME', 'SOURCE_FILE', 'JSS_USERNAME', 'JSS_PASSWORD',
+                'JSS_DOMAIN', 'DEVICE_TYPE', 'XML_ROOT')
 
 BUCKET_NAME = os.getenv('BUCKET_NAME')
 SOURCE_FILE = os.getenv('SOURCE_FILE')
 
-URL = 'https://' + os.path.join(
-    os.getenv('JSS_DOMAIN'),
-    'JSSResource',
-    os.getenv('DEVICE_TYPE').lower(),
-    'serialnumber'
-)
-
 XML_ROOT = os.getenv('XML_ROOT')
 XML_KEY_MAP = {
     'barcode_1': 'general/barcode_1',
@@ -50,18 +43,25 @@ XML_KEY_MAP = {
 }
 
 
-def is_valid_event(webhook):
-    if not webhook or not webhook.get('webhookEvent'):
-        return False
+def check_config():
+    missing = [name for name in REQUIRED_ENV if not os.getenv(name)]
+    if missing:
+        raise Exception('Missing environment variables required for Populator '
+                        f"operation: {', '.join(missing)}")
 
-    if webhook['webhookEvent'] in ('ComputerAdded', 'MobileDeviceEnrolled'):
-        return True
-    else:
-        return False
+
+def api_url():
+    return 'https://' + os.path.join(
+        os.getenv('JSS_DOMAIN'),
+        'JSSResource',
+        os.getenv('DEVICE_TYPE').lower(),
+        'serialnumber'
+    )
 
 
 def query_s3(serial_number):
-    client = boto3.client('s3')
+    client = aws_client('s3')
+    from botocore.exceptions import ClientError
 
     try:
         resp = client.select_object_content(
@@ -94,6 +94,8 @@ def query_s3(serial_number):
 
 
 def generate_xml(data):
+    from xml.etree import ElementTree as ET
+
     xml_root = ET.Element(XML_ROOT)
 
     general = ET.SubElement(xml_root, 'general')
@@ -121,11 +123,13 @@ def generate_xml(data):
 
 
 def update_jamf_pro_record(data):
+    from botocore.vendored import requests
+
     xml = generate_xml(data)
 
     try:
         resp = requests.put(
-            os.path.join(URL, data['serial_number']),
+            os.path.join(api_url(), data['serial_number']),
             headers={'Content-Type': 'text/xml'},
             data=xml,
             auth=(os.getenv('JSS_USERNAME'), os.getenv('JSS_PASSWORD')),
@@ -150,36 +154,30 @@ def lambda_handler(event, context):
     2) Query S3 file using serial number
     3) Perform update on record in Jamf Pro
     """
+    check_config()
+
     if event.get('Records'):
         logging.info('Processing SNS records...')
         for record in event['Records']:
             try:
-                event_data = json.loads(record['Sns']['Message'])
-            except (TypeError, json.JSONDecodeError):
-                logger.exception('Bad Request: No JSON content found')
-                return {}
-
-            webhook_event = event_data.get('event')
-            webhook_data = event_data.get('webhook')
-
-            if not webhook_event and webhook_data:
-                logger.error('Invalid data passed by SNS notification')
-                return {}
+                webhook_event = WebhookEvent.from_message(
+                    json.loads(record['Sns']['Message']))
+            except (KeyError, TypeError, json.JSONDecodeError):
+                logger.exception('Invalid data passed by SNS notification')
+                continue
 
-            if not is_valid_event(webhook_data):
+            if webhook_event.event_type not in SUPPORTED_EVENTS:
                 logger.info('The webhook event is not supported.')
-                return {}
+                continue
 
-            serial_number = webhook_event.get('serialNumber')
-            if not serial_number:
-                logger.error('A device serial number was not found')
-                return {}
+            # The Webhook Receiver has validated the serial number is present
+            serial_number = webhook_event.data['serialNumber']
 
             s3_record = query_s3(serial_number)
             if not s3_record:
                 logger.info(f'The serial {serial_number} number was not found '
                             'in the data source')
-                return {}
+                continue
 
             update_jamf_pro_record(s3_record)
 
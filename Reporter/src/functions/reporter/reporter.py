@@ -0,0 +1,360 @@
+"""Render Jamf Pro Poller results as CSV or HTML reports."""
+import csv
+import gzip
+import hashlib
+import html
+import io
+import json
+import logging
+import os
+import time
+
+from aws_clients import aws_client
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.getenv('BUCKET_NAME')
+OUTPUT_DIR = os.getenv('OUTPUT_DIR')
+REPORT_FORMAT = os.getenv('REPORT_FORMAT', 'CSV').upper()
+COMPRESSION = os.getenv('COMPRESSION', 'None').upper()
+INCREMENTAL = os.getenv('INCREMENTAL', 'false').lower() == 'true'
+
+# S3 requires every part of a multipart upload except the last to be >= 5 MiB
+PART_SIZE = 5 * 1024 * 1024
+
+# The keys holding the result rows in group and advanced search API objects
+ROW_KEYS = ('computers', 'mobile_devices', 'users')
+
+
+_content_types = {
+    'CSV': 'text/csv',
+    'HTML': 'text/html'
+}
+
+
+class S3MultipartWriter(object):
+    """A write-only file object that streams bytes into an S3 object.
+
+    Data is buffered until a full part is available and then sent with
+    ``upload_part``. Reports smaller than a single part are written with
+    ``put_object`` so no multipart upload is created for them.
+
+    :param client: A boto3 S3 client.
+    :param str bucket: The destination bucket.
+    :param str key: The destination key.
+    :param str content_type: The ``Content-Type`` of the object.
+    :param str content_encoding: An optional ``Content-Encoding``.
+    """
+    def __init__(self, client, bucket, key, content_type,
+                 content_encoding=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.extra_args = {'ContentType': content_type}
+        if content_encoding:
+            self.extra_args['ContentEncoding'] = content_encoding
+
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+    def write(self, data):
+        self._buffer.extend(data)
+        if len(self._buffer) >= PART_SIZE:
+            self._upload_part()
+
+    def flush(self):
+        pass
+
+    def _upload_part(self):
+        if not self._upload_id:
+            resp = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra_args)
+            self._upload_id = resp['UploadId']
+
+        part_number = len(self._parts) + 1
+        resp = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=bytes(self._buffer)
+        )
+        self._parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+        self._buffer.clear()
+
+    def close(self):
+        if not self._upload_id:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                **self.extra_args
+            )
+            return
+
+        if self._buffer:
+            self._upload_part()
+
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={'Parts': self._parts}
+        )
+
+    def abort(self):
+        if not self._upload_id:
+            return
+
+        # Do not let a failed abort replace the error that caused it; the
+        # bucket's lifecycle rule cleans up any parts left behind
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception:
+            logger.exception(f'Unable to abort multipart upload: {self.key}')
+
+
+class LocalFileWriter(object):
+    """A local stand-in for :class:`S3MultipartWriter` used when
+    ``OUTPUT_DIR`` is set (e.g. with ``sam local invoke``).
+
+    :param str path: The destination file path.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+    def write(self, data):
+        self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path)
+
+
+def open_writer(key, content_type, content_encoding=None):
+    """Return a writer for the report ``key`` in S3, or under ``OUTPUT_DIR``
+    if it is set.
+    """
+    if OUTPUT_DIR:
+        return LocalFileWriter(os.path.join(OUTPUT_DIR, key))
+
+    return S3MultipartWriter(aws_client('s3'), BUCKET_NAME, key,
+                             content_type, content_encoding)
+
+
+def read_state(key):
+    """Return the row digests saved by the previous run of a report.
+
+    :returns: Mapping of row IDs to row digests.
+    :rtype: dict
+    """
+    if OUTPUT_DIR:
+        try:
+            with open(os.path.join(OUTPUT_DIR, key), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return {}
+
+        return json.loads(gzip.decompress(body).decode())
+
+    client = aws_client('s3')
+    from botocore.exceptions import ClientError
+
+    try:
+        body = client.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read()
+    except ClientError as err:
+        if err.response['Error']['Code'] == 'NoSuchKey':
+            return {}
+        logger.exception('Unable to read previous report state')
+        raise
+
+    return json.loads(gzip.decompress(body).decode())
+
+
+def write_state(key, state):
+    with open_writer(key, 'application/json', 'gzip') as writer:
+        writer.write(gzip.compress(json.dumps(state).encode()))
+
+
+def extract_rows(data):
+    """Return the name and result rows of a group or advanced search from the
+    Poller's API data.
+
+    :param dict data: Jamf Pro API JSON as dictionary.
+
+    :raises ValueError: The data is not a group or advanced search with a
+        list of row objects.
+
+    :returns: The object name, object ID and the list of rows.
+    :rtype: tuple
+    """
+    api_object = next(iter(data.values()), None) \
+        if isinstance(data, dict) else None
+    if not isinstance(api_object, dict):
+        raise ValueError('No API object found in the Poller data')
+
+    for key in ROW_KEYS:
+        rows = api_object.get(key)
+        if isinstance(rows, list):
+            if not all(isinstance(row, dict) for row in rows):
+                raise ValueError(f"The '{key}' rows must be objects")
+            return api_object.get('name'), api_object.get('id'), rows
+
+    raise ValueError('No result rows found in the Poller data')
+
+
+def row_digest(row):
+    return hashlib.sha1(
+        json.dumps(row, sort_keys=True).encode()).hexdigest()
+
+
+def diff_rows(rows, previous_state, state):
+    """Yield only the rows that were added or modified since the previous
+    run followed by the rows that were removed.
+
+    ``state`` is populated with the digests of the current rows as they are
+    read so it can be saved for the next run.
+    """
+    for row in rows:
+        row_id = str(row.get('id', row_digest(row)))
+        digest = row_digest(row)
+        state[row_id] = digest
+
+        previous_digest = previous_state.pop(row_id, None)
+        if previous_digest is None:
+            yield dict(row, change='Added')
+        elif previous_digest != digest:
+            yield dict(row, change='Modified')
+
+    for row_id in previous_state:
+        yield {'id': row_id, 'change': 'Removed'}
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return '' if value is None else str(value)
+
+
+def render_csv(columns, rows):
+    """Yield a CSV document one line at a time."""
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def _line(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield _line(columns)
+    for row in rows:
+        yield _line([_cell(row.get(column)) for column in columns])
+
+
+def render_html(title, columns, rows):
+    """Yield an HTML table document one row at a time."""
+    title = html.escape(title)
+    yield (
+        '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+        f'<title>{title}</title>\n</head>\n<body>\n<h1>{title}</h1>\n'
+        '<table border="1">\n<tr>'
+        + ''.join(f'<th>{html.escape(c)}</th>' for c in columns)
+        + '</tr>\n'
+    )
+
+    for row in rows:
+        yield '<tr>' + ''.join(
+            f'<td>{html.escape(_cell(row.get(c)))}</td>' for c in columns
+        ) + '</tr>\n'
+
+    yield '</table>\n</body>\n</html>\n'
+
+
+def write_report(key, title, columns, rows):
+    """Render ``rows`` into the report at ``key`` without holding the whole
+    document in memory.
+    """
+    if REPORT_FORMAT == 'HTML':
+        chunks = render_html(title, columns, rows)
+    else:
+        chunks = render_csv(columns, rows)
+
+    compress = COMPRESSION == 'GZIP'
+    with open_writer(key, _content_types.get(REPORT_FORMAT, 'text/csv'),
+                     'gzip' if compress else None) as writer:
+        if compress:
+            with gzip.GzipFile(fileobj=writer, mode='wb') as gz:
+                for chunk in chunks:
+                    gz.write(chunk.encode())
+        else:
+            for chunk in chunks:
+                writer.write(chunk.encode())
+
+
+def lambda_handler(event, context):
+    if event.get('Records'):
+        logging.info('Processing SNS records...')
+        for record in event['Records']:
+            try:
+                data = json.loads(record['Sns']['Message'])
+                name, object_id, rows = extract_rows(data)
+            except (KeyError, TypeError, ValueError):
+                logger.exception('Bad Request: No Poller data found')
+                continue
+
+            report_name = f'{next(iter(data))}-{object_id}'
+            title = name or report_name
+            columns = list(rows[0].keys()) if rows else ['id']
+
+            if INCREMENTAL:
+                state_key = f'state/{report_name}.json.gz'
+                state = dict()
+                rows = diff_rows(rows, read_state(state_key), state)
+                columns.append('change')
+
+            key = f"reports/{report_name}/" \
+                f"{time.strftime('%Y-%m-%dT%H%M%SZ', time.gmtime())}" \
+                f".{REPORT_FORMAT.lower()}"
+            if COMPRESSION == 'GZIP':
+                key += '.gz'
+
+            logger.info(f'Writing report: {key}')
+            try:
+                write_report(key, title, columns, rows)
+                if INCREMENTAL:
+                    write_state(state_key, state)
+            except Exception:
+                logger.exception('Unable to write report')
+                raise
+
+    return {}
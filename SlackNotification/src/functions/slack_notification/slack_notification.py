@@ -1,16 +1,44 @@
 """Create formatted Slack messages from Jamf Pro webhooks."""
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import os
 import time
 
-from botocore.vendored import requests
+from jamf_events import WebhookEvent
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
-IGNORED_EVENTS = os.getenv('IGNORED_EVENTS').split(',')
+IGNORED_EVENTS = [
+    name for name in os.getenv('IGNORED_EVENTS', '').split(',') if name]
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '8'))
+
+# Posts that are rate limited (429) or fail with a server or connection error
+# are retried with an increasing delay before the record is counted as failed
+MAX_ATTEMPTS = 3
+MAX_RETRY_DELAY = 10
+POST_TIMEOUT = 10
+
+# Seconds kept back from the invocation's remaining time to return the
+# results. A post or retry that would not finish before then is not started
+# and its record is retried from the queue instead, so the invocation never
+# times out and redelivers notifications that were already sent.
+TIME_MARGIN = 2
+
+# Record results reported in the batch summary
+SENT = 'sent'
+SKIPPED = 'skipped'
+INVALID = 'invalid'
+FAILED = 'failed'
+
+
+class NotificationError(Exception):
+    """A notification could not be posted in the time the invocation has
+    left, or notifications for SNS records failed so Lambda must retry the
+    invocation.
+    """
 
 
 def _computer_added(data):
@@ -26,7 +54,7 @@ def _computer_added(data):
         '*ID:* {} | *Serial Number:* {}\n'
         '*Computer Name:* {} | *User:* {}'.format(
             data['jssID'], data['serialNumber'],
-            data['deviceName'], data['username']
+            data.get('deviceName'), data.get('username')
         ),
         'Computer Added',
         color='green',
@@ -42,12 +70,13 @@ def _computer_checkin(data):
     :returns: Formatted Slack message.
     :rtype: dict
     """
+    computer = data['computer']
     return _message(
         'A computer check-in has occurred.\n'
         '*ID:* {} | *Serial Number:* {}\n'
         '*Computer Name:* {} | *User:* {}'.format(
-            data['jssID'], data['serialNumber'],
-            data['deviceName'], data['username']
+            computer['jssID'], computer['serialNumber'],
+            computer.get('deviceName'), computer.get('username')
         ),
         'Computer Check-In',
         color='gray',
@@ -64,12 +93,13 @@ def _computer_inventory(data):
     :returns: Formatted Slack message.
     :rtype: dict
     """
+    computer = data['computer']
     return _message(
         'A computer has submitted inventory.\n'
         '*ID:* {} | *Serial Number:* {}\n'
         '*Computer Name:* {} | *User:* {}'.format(
-            data['jssID'], data['serialNumber'],
-            data['deviceName'], data['username']
+            computer['jssID'], computer['serialNumber'],
+            computer.get('deviceName'), computer.get('username')
         ),
         'Computer Inventory Complete',
         color='gray',
@@ -125,7 +155,7 @@ def _mobile_checkin(data):
         '*ID:* {} | *Serial Number:* {}\n'
         '*Device Name:* {} | *User:* {}'.format(
             data['jssID'], data['serialNumber'],
-            data['deviceName'], data['username']
+            data.get('deviceName'), data.get('username')
         ),
         'Mobile Device Check-In',
         color='gray',
@@ -146,7 +176,7 @@ def _mobile_enrolled(data):
         '*ID:* {} | *Serial Number:* {}\n'
         '*Device Name:* {} | *User:* {}'.format(
             data['jssID'], data['serialNumber'],
-            data['deviceName'], data['username']
+            data.get('deviceName'), data.get('username')
         ),
         'Mobile Device Enrolled',
         color='green',
@@ -167,7 +197,7 @@ def _mobile_unenrolled(data):
         '*ID:* {} | *Serial Number:* {}\n'
         '*Device Name:* {} | *User:* {}'.format(
             data['jssID'], data['serialNumber'],
-            data['deviceName'], data['username']
+            data.get('deviceName'), data.get('username')
         ),
         'Mobile Device Un-Enrolled',
         color='yellow',
@@ -209,8 +239,8 @@ def _rest_api_operation(data):
         '*API Object Type* {} | *Name:* {} | *ID:* {}\n'
         '*User:* {} | *Action:* {} | *Success?* {}'.format(
             data['objectTypeName'],
-            data['objectName'],
-            data['objectID'],
+            data.get('objectName'),
+            data.get('objectID'),
             data['authorizedUsername'],
             data['restAPIOperationType'],
             data['operationSuccessful']
@@ -311,56 +341,212 @@ _webhook_events = {
 }
 
 
-def _webhook_notification(webhook):
+def _webhook_notification(webhook_event):
     """Takes a Jamf Pro webhook event object and returns a formatted Slack
     message from the details if it is in the supported webhook events list.
 
     If the webhook event is not supported ``None`` will be returned.
 
-    :param webhook: Jamf Pro webhook JSON as dictionary.
+    :param WebhookEvent webhook_event: The Jamf Pro webhook event.
+
+    :raises KeyError: The event data is missing a field the message requires.
 
     :return: Formatted Slack message.
     :rtype: dict or None
     """
-    event_type = webhook['webhook']['webhookEvent']
+    event_type = webhook_event.event_type
     if event_type in _webhook_events:
         logger.info('Parsing webhook event: {}'.format(event_type))
-        return _webhook_events[event_type](webhook['event'])
+        return _webhook_events[event_type](webhook_event.data)
     else:
         logger.warning('Did not find a supported webhook event type')
         return None
 
 
-def send_notification(webhook):
+_session = None
+
+
+def _http_session():
+    """Return a ``requests`` session shared by all records so connections to
+    Slack are reused.
+    """
+    global _session
+    if _session is None:
+        # Imported on first use to keep cold starts short
+        from botocore.vendored import requests
+        _session = requests.Session()
+    return _session
+
+
+def _retry_delay(resp, attempt):
+    """Return the seconds to wait before retrying a post, using the
+    ``Retry-After`` header of a rate limited response if it has one.
+    """
+    delay = 2 ** (attempt - 1)
+    if resp is not None:
+        try:
+            delay = int(resp.headers.get('Retry-After', delay))
+        except (TypeError, ValueError):
+            pass
+    return min(max(delay, 0), MAX_RETRY_DELAY)
+
+
+def post_message(message, deadline):
+    """Post a message to the Slack webhook, retrying rate limited and
+    failed requests up to ``MAX_ATTEMPTS`` times.
+
+    :param dict message: A formatted Slack message.
+    :param float deadline: The ``time.monotonic()`` value by which the post
+        and any retries must have finished.
+
+    :raises NotificationError: There is not enough time left to post.
+    :raises requests.RequestException: The message could not be posted.
+    """
+    from botocore.vendored import requests
+
+    session = _http_session()
+    headers = {'Content-Type': 'application/json'}
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if deadline - time.monotonic() < POST_TIMEOUT:
+            raise NotificationError('Not enough time left to post to Slack')
+
+        resp = None
+        try:
+            resp = session.post(SLACK_WEBHOOK_URL, headers=headers,
+                                json=message, timeout=POST_TIMEOUT)
+            resp.raise_for_status()
+            return
+        except (requests.ConnectionError, requests.Timeout,
+                requests.HTTPError) as err:
+            retryable = resp is None or resp.status_code == 429 or \
+                resp.status_code >= 500
+            delay = _retry_delay(resp, attempt)
+            if not retryable or attempt == MAX_ATTEMPTS or \
+                    deadline - time.monotonic() < delay + POST_TIMEOUT:
+                raise
+
+            logger.warning(f'Unable to post to Slack ({err}); retrying in '
+                           f'{delay} second(s)')
+            time.sleep(delay)
+
+
+def send_notification(webhook_event, deadline):
     """Send a formatted Slack message to a channel's inbound webhook.
 
-    :param dict webhook: Jamf Pro webhook JSON data.
+    :param WebhookEvent webhook_event: The Jamf Pro webhook event.
+    :param float deadline: See :func:`post_message`.
+
+    :raises KeyError: The event data is missing a field the message requires.
+    :raises NotificationError: There is not enough time left to post.
+    :raises requests.RequestException: The message could not be posted.
+
+    :returns: ``SENT`` or ``SKIPPED``.
+    :rtype: str
     """
-    if webhook['webhook']['webhookEvent'] in IGNORED_EVENTS:
+    if webhook_event.event_type in IGNORED_EVENTS:
         logger.info('Webhook event is listed in ignored events; skipping...')
-        return
+        return SKIPPED
+
+    message = _webhook_notification(webhook_event)
+    if not message:
+        return SKIPPED
+
+    post_message(message, deadline)
+    return SENT
+
+
+def _record_message(record):
+    """Return the message of an SNS record, or of an SQS record from a queue
+    subscribed to the topic with or without raw message delivery.
+    """
+    if 'Sns' in record:
+        return record['Sns']['Message']
+
+    body = json.loads(record['body'])
+    if isinstance(body, dict) and body.get('Type') == 'Notification':
+        return body['Message']
+    return record['body']
+
+
+def process_record(record, deadline):
+    """Send the notification for a single record. Any error is logged and
+    returned as the result so one record cannot fail the batch.
+
+    :param dict record: An SNS or SQS record.
+    :param float deadline: See :func:`post_message`.
+
+    :returns: ``SENT``, ``SKIPPED``, ``INVALID`` or ``FAILED``.
+    :rtype: str
+    """
+    try:
+        webhook_event = WebhookEvent.from_message(
+            json.loads(_record_message(record)))
+    except (KeyError, TypeError, json.JSONDecodeError):
+        logger.exception('Bad Request: No webhook event found')
+        return INVALID
 
-    message = _webhook_notification(webhook)
-    headers = {'Content-Type': 'application/json'}
     try:
-        resp = requests.post(SLACK_WEBHOOK_URL, headers=headers, json=message)
-    except requests.HTTPError:
+        return send_notification(webhook_event, deadline)
+    except (KeyError, TypeError, AttributeError):
+        logger.exception('Webhook data is missing required fields')
+        return INVALID
+    except NotificationError as err:
+        logger.warning(f'{err}; the record will be retried')
+        return FAILED
+    except Exception:
         logger.exception(f'Unable to post to Slack: {SLACK_WEBHOOK_URL}')
-        raise
+        return FAILED
 
 
 def lambda_handler(event, context):
-    logger.info(f"Ignored Webhook Events: {', '.join(IGNORED_EVENTS)}")
+    """Sends the notifications for a batch of records concurrently, up to
+    ``MAX_WORKERS`` at a time, and returns a summary of the results.
+
+    Posts are only started or retried while they can finish within the
+    invocation's remaining time; the records left over are failed and
+    retried from the queue.
 
-    if event.get('Records'):
-        logging.info('Processing SNS records...')
-        for record in event['Records']:
-            try:
-                event_data = json.loads(record['Sns']['Message'])
-            except (TypeError, json.JSONDecodeError):
-                logger.exception('Bad Request: No JSON content found')
-                return {}
+    Records are delivered from the component's queue, and failed posts are
+    returned as ``batchItemFailures`` so only those messages are retried
+    (the event source must report batch item failures). SNS records have no
+    such mechanism, so if any of them failed the summary is logged
+    and :class:`NotificationError` is raised for Lambda to retry the whole
+    invocation (notifications already sent may then be posted again).
 
-            send_notification(event_data)
+    :raises NotificationError: A notification for an SNS record failed.
+    """
+    logger.info(f"Ignored Webhook Events: {', '.join(IGNORED_EVENTS)}")
 
-    return {}
+    records = event.get('Records') or []
+    summary = {SENT: 0, SKIPPED: 0, INVALID: 0, FAILED: 0}
+    if not records:
+        return summary
+
+    deadline = time.monotonic() + \
+        context.get_remaining_time_in_millis() / 1000 - TIME_MARGIN
+
+    logging.info(f'Processing {len(records)} record(s)...')
+    with ThreadPoolExecutor(
+            max_workers=min(MAX_WORKERS, len(records))) as executor:
+        results = list(executor.map(
+            lambda record: process_record(record, deadline), records))
+
+    batch_item_failures = list()
+    unretried = 0
+    for record, result in zip(records, results):
+        summary[result] += 1
+        if result != FAILED:
+            continue
+        if 'messageId' in record:
+            batch_item_failures.append(
+                {'itemIdentifier': record['messageId']})
+        else:
+            unretried += 1
+
+    logger.info(f'Batch summary: {json.dumps(summary)}')
+    if unretried:
+        raise NotificationError(
+            f'Unable to post {unretried} notification(s) to Slack')
+
+    summary['batchItemFailures'] = batch_item_failures
+    return summary
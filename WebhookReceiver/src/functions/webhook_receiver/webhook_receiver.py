@@ -1,12 +1,17 @@
 import base64
+import binascii
+import codecs
 from hmac import compare_digest
 import json
 import logging
 import os
+import zlib
 
 import boto3
 from botocore.exceptions import ClientError
 
+from jamf_events import InvalidWebhook, validate_webhook
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -14,6 +19,34 @@ ACCESS_TOKEN = os.getenv('ACCESS_TOKEN', None)
 USERNAME = os.getenv('USERNAME', None)
 PASSWORD = os.getenv('PASSWORD', None)
 WEBHOOK_TOPIC = os.getenv('WEBHOOK_TOPIC')
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '8'))
+
+# Size of the pieces a request body is decoded in (a multiple of 4 so base64
+# can be decoded piece by piece)
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+# The maximum number of entries and total size of an SNS ``PublishBatch``
+# request (messages and their attributes)
+MAX_BATCH_SIZE = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+# Every accepted webhook is published before Jamf Pro gets a response, so
+# creating the client lazily would only move its cost into that response.
+# It is created during the function's init phase instead.
+sns_client = boto3.client('sns')
+
+
+class BodyDecodeError(ValueError):
+    """The request body could not be decoded.
+
+    :param str message: The error.
+    :param int offset: The position in the decoded body text the error
+        occurred at.
+    """
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
 
 
 def response(message, status_code):
@@ -53,36 +86,256 @@ def authenticate(auth_header):
         compare_digest(password, PASSWORD)
 
 
-def publish_event(event_data):
-    sns_client = boto3.client('sns')
+def _header(headers, name):
+    name = name.lower()
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def body_chunks(event):
+    """Yield the text of the request body piece by piece, decoding base64
+    (``isBase64Encoded``) and gzip (``Content-Encoding: gzip`` or a gzip
+    header) as it is read.
+
+    :param dict event: The API Gateway proxy event.
+
+    :raises ValueError: The body could not be decoded.
+    """
+    body = event.get('body') or ''
+    if not event.get('isBase64Encoded'):
+        for i in range(0, len(body), CHUNK_SIZE):
+            yield body[i:i + CHUNK_SIZE]
+        return
+
+    text = codecs.getincrementaldecoder('utf-8')()
+    decompressor = None
+    gzip_header = _header(event.get('headers'), 'Content-Encoding') == 'gzip'
 
     try:
-        resp = sns_client.publish(
+        for i in range(0, len(body), CHUNK_SIZE):
+            data = base64.b64decode(body[i:i + CHUNK_SIZE])
+            if i == 0 and (gzip_header or data.startswith(GZIP_MAGIC)):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if decompressor:
+                data = decompressor.decompress(data)
+            yield text.decode(data)
+
+        if decompressor:
+            if not decompressor.eof:
+                raise ValueError('Truncated gzip body')
+            yield text.decode(decompressor.flush(), final=True)
+        else:
+            yield text.decode(b'', final=True)
+    except (binascii.Error, zlib.error, UnicodeDecodeError) as err:
+        raise ValueError(f'Unable to decode body: {err}')
+
+
+def _decode_documents(buffer, decoder, final):
+    """Decode the complete JSON documents at the start of ``buffer``.
+
+    :returns: The documents, the rest of the buffer and, if ``final`` and
+        the rest is not valid JSON, the :class:`json.JSONDecodeError`.
+    :rtype: tuple
+    """
+    documents = list()
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos == len(buffer):
+            break
+
+        try:
+            document, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as err:
+            return documents, buffer[pos:], err if final else None
+        documents.append(document)
+
+    return documents, buffer[pos:], None
+
+
+def iter_webhooks(chunks):
+    """Yield each JSON document in a body of one or more documents
+    (newline-delimited, concatenated or a JSON array) as soon as it is
+    complete.
+
+    :param chunks: The body text in pieces.
+
+    :raises BodyDecodeError: The body could not be decoded or contains
+        invalid JSON. Every document before the error has been yielded.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    # The number of characters of the body before ``buffer``
+    offset = 0
+    retry_at = 0
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            # After an incomplete document wait until the buffer has doubled
+            # before decoding again so large documents are not re-parsed for
+            # every chunk
+            if len(buffer) < retry_at:
+                continue
+
+            documents, remaining, _ = _decode_documents(
+                buffer, decoder, False)
+            offset += len(buffer) - len(remaining)
+            buffer = remaining
+            retry_at = 2 * len(buffer)
+            yield from _flatten(documents)
+    except ValueError as err:
+        # Decode the documents that were read before the error
+        documents, _, _ = _decode_documents(buffer, decoder, False)
+        yield from _flatten(documents)
+        raise BodyDecodeError(str(err), offset + len(buffer))
+
+    documents, _, err = _decode_documents(buffer, decoder, True)
+    yield from _flatten(documents)
+    if err:
+        raise BodyDecodeError(f'Invalid JSON: {err.msg}', offset + err.pos)
+
+
+def _flatten(documents):
+    for document in documents:
+        if isinstance(document, list):
+            yield from document
+        else:
+            yield document
+
+
+def batch_entry(webhook_event):
+    """Return the ``PublishBatch`` entry for a validated webhook and its size
+    as counted towards the batch limit.
+
+    The event type is set as the ``webhookEvent`` message attribute so
+    subscriptions can filter on it.
+
+    :rtype: tuple
+    """
+    message = json.dumps(webhook_event.to_message())
+    entry = {
+        'Message': message,
+        'MessageAttributes': {
+            'webhookEvent': {
+                'DataType': 'String',
+                'StringValue': webhook_event.event_type
+            }
+        }
+    }
+    size = len(message.encode()) + len('webhookEvent') + len('String') + \
+        len(webhook_event.event_type.encode())
+    return entry, size
+
+
+def publish_events(entries):
+    """Publish webhooks to the SNS topic in a single batch request.
+
+    :param list entries: Up to ``MAX_BATCH_SIZE`` entries from
+        :func:`batch_entry` within ``MAX_BATCH_BYTES``.
+
+    :returns: The number of webhooks that failed to publish.
+    :rtype: int
+    """
+    try:
+        resp = sns_client.publish_batch(
             TopicArn=WEBHOOK_TOPIC,
-            Message=json.dumps(event_data),
-            MessageStructure='string'
+            PublishBatchRequestEntries=[
+                dict(entry, Id=str(index))
+                for index, entry in enumerate(entries)
+            ]
         )
     except ClientError:
         logger.exception('Error sending SNS notification')
-        raise
+        return len(entries)
+
+    for failed in resp.get('Failed', []):
+        logger.error(f"Error sending SNS notification: {failed['Message']}")
+
+    return len(resp.get('Failed', []))
+
+
+def process_body(event):
+    """Decode, validate and publish every webhook in the request body.
+
+    Webhooks are published in batches of up to ``MAX_BATCH_SIZE`` entries
+    and ``MAX_BATCH_BYTES``; a webhook too large to share a batch is published
+    on its own. Batches are published in parallel, up to ``MAX_WORKERS`` at a
+    time, while the rest of the body is still being decoded. A body with a
+    single batch is published without starting any threads.
+
+    If the body cannot be decoded partway through, the webhooks before the
+    error are still published.
+
+    :param dict event: The API Gateway proxy event.
+
+    :returns: The number of webhooks published, the rejected webhooks as
+        ``(index, error)``, the number that failed to publish and the
+        :class:`BodyDecodeError` that stopped decoding, if any.
+    :rtype: tuple
+    """
+    rejected = list()
+    futures = list()
+    batch = list()
+    batch_bytes = 0
+    total = 0
+    failed = 0
+    decode_error = None
+    executor = None
+
+    try:
+        for index, payload in enumerate(iter_webhooks(body_chunks(event))):
+            total += 1
+            try:
+                entry, size = batch_entry(validate_webhook(payload))
+            except InvalidWebhook as err:
+                rejected.append((index, str(err)))
+                continue
+
+            if batch and (len(batch) == MAX_BATCH_SIZE or
+                          batch_bytes + size > MAX_BATCH_BYTES):
+                if not executor:
+                    from concurrent.futures import ThreadPoolExecutor
+                    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+                futures.append(executor.submit(publish_events, batch))
+                batch = list()
+                batch_bytes = 0
+
+            batch.append(entry)
+            batch_bytes += size
+    except BodyDecodeError as err:
+        logger.error(f'Unable to decode body at offset {err.offset}: {err}')
+        decode_error = err
+    finally:
+        if batch:
+            failed += publish_events(batch)
+        if executor:
+            executor.shutdown()
+            failed += sum(future.result() for future in futures)
+
+    published = total - len(rejected) - failed
+    return published, rejected, failed, decode_error
 
 
 def lambda_handler(event, context):
-    """Processes an inbound webhook from Jamf Pro and publishes to an SNS topic.
+    """Processes inbound webhooks from Jamf Pro and publishes them to an SNS
+    topic.
 
     If there is an ``ACCESS_TOKEN`` value present, inbound requests are required
     to have a ``?access_token=XXX`` query string parameter to authenticated to
     the processor.
 
     If there is no ``ACCESS_TOKEN`` requests can be unauthenticated.
-    """
-    logger.info(event)
-    try:
-        request_data = json.loads(event['body'])
-    except (TypeError, json.JSONDecodeError):
-        logger.exception('Bad Request: No JSON content found')
-        return response('Bad Request: No JSON content found', 400)
 
+    The body may be base64 encoded and gzip compressed, and may contain more
+    than one webhook as newline-delimited JSON or a JSON array (e.g. from a
+    relay catching up after an outage). Authenticated webhooks are validated
+    against the schema of their event type before they are published.
+    Malformed webhooks are rejected.
+    """
+    logger.info({key: value for key, value in event.items() if key != 'body'})
     if ACCESS_TOKEN:
         logger.info('Token authentication required....')
         query_string_params = event['queryStringParameters'] or {}
@@ -101,9 +354,48 @@ def lambda_handler(event, context):
             logger.error('Bad username/password')
             return response('Unauthorized', 401)
 
-    try:
-        publish_event(request_data)
-    except ClientError:
-        return response('Internal Server Error', 500)
+    published, rejected, failed, decode_error = process_body(event)
+    total = published + len(rejected) + failed
+    logger.info(f'Published {published} of {total} webhook(s)')
+
+    if total == 0 and not decode_error:
+        return response('Bad Request: No JSON content found', 400)
+
+    if total == 1 and not decode_error:
+        if rejected:
+            logger.error(f'Bad Request: {rejected[0][1]}')
+            return response(f'Bad Request: {rejected[0][1]}', 400)
+        if failed:
+            return response('Internal Server Error', 500)
+        return response('Success', 201)
+
+    summary = {
+        'message': 'Success',
+        'published': published,
+        'failed': failed,
+        'rejected': [
+            {'index': index, 'error': error} for index, error in rejected
+        ]
+    }
+    if decode_error:
+        summary['decode_error'] = {
+            'offset': decode_error.offset,
+            'error': str(decode_error)
+        }
+        # The webhooks after the error were not read, so the body is only
+        # partially accepted even if everything before it was published
+        if not published:
+            summary['message'] = 'Bad Request: Unable to decode body'
+            return response(summary, 400)
+        summary['message'] = 'Partial Success'
+        return response(summary, 207)
+
+    if not published:
+        summary['message'] = 'Internal Server Error' if failed \
+            else 'Bad Request'
+        return response(summary, 500 if failed else 400)
+    if rejected or failed:
+        summary['message'] = 'Partial Success'
+        return response(summary, 207)
 
-    return response('Success', 201)
+    return response(summary, 201)
@@ -0,0 +1,184 @@
+"""Build startup-optimized deployment artifacts for the components.
+
+Each component's functions are copied to ``build/<Component>/`` along with
+its ``template.yaml`` so the built template can be packaged with::
+
+    sam package --template-file build/<Component>/template.yaml ...
+
+While copying the build:
+
+- Installs a function's ``requirements.txt`` into the function directory.
+- Removes the botocore and boto3 service models for every AWS service the
+  function does not create a client for.
+- Removes caches, tests and package metadata.
+- Precompiles the sources to bytecode. The deployment package is read-only
+  so Lambda would otherwise compile every module on each cold start. Run the
+  build with the same Python version as the function runtime (python3.6).
+
+  Bytecode in ``__pycache__`` is checked against the modification time of
+  its source, which packaging does not preserve (zip timestamps have a two
+  second resolution and no time zone). Sources are compiled to sourceless
+  ``.pyc`` files next to them instead and the ``.py`` files are removed, so
+  the bytecode is always used. Tracebacks then show no source lines.
+"""
+import argparse
+import compileall
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLIENT_PATTERN = re.compile(
+    r"""(?:aws_client|boto3\.client)\(\s*['"]([\w-]+)['"]""")
+# Service models that botocore may load without an explicit client
+ALWAYS_KEEP = {'sts'}
+STRIP_DIRS = ('__pycache__', 'tests', 'test')
+STRIP_SUFFIXES = ('.dist-info', '.egg-info')
+
+
+def components(names=None):
+    for name in sorted(os.listdir(ROOT)):
+        if names and name not in names:
+            continue
+        if os.path.isfile(os.path.join(ROOT, name, 'template.yaml')):
+            yield name
+
+
+def used_services(function_dir):
+    """Return the AWS service names the function's own modules create
+    clients for.
+    """
+    services = set()
+    for file_name in os.listdir(function_dir):
+        if file_name.endswith('.py'):
+            with open(os.path.join(function_dir, file_name)) as f:
+                services.update(CLIENT_PATTERN.findall(f.read()))
+
+    return services
+
+
+def strip_service_models(function_dir, services):
+    """Remove the service model directories of unused services from any
+    vendored botocore or boto3.
+
+    :returns: The number of bytes removed.
+    :rtype: int
+    """
+    removed = 0
+    for package in ('botocore', 'boto3'):
+        data_dir = os.path.join(function_dir, package, 'data')
+        if not os.path.isdir(data_dir):
+            continue
+
+        for name in os.listdir(data_dir):
+            path = os.path.join(data_dir, name)
+            if os.path.isdir(path) and name not in services | ALWAYS_KEEP:
+                removed += directory_size(path)
+                shutil.rmtree(path)
+
+    return removed
+
+
+def strip_package_files(function_dir):
+    removed = 0
+    for dir_path, dir_names, _ in os.walk(function_dir):
+        for name in list(dir_names):
+            if name in STRIP_DIRS or name.endswith(STRIP_SUFFIXES):
+                path = os.path.join(dir_path, name)
+                removed += directory_size(path)
+                shutil.rmtree(path)
+                dir_names.remove(name)
+
+    return removed
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(dir_path, name))
+        for dir_path, _, file_names in os.walk(path)
+        for name in file_names
+    )
+
+
+def compile_sourceless(function_dir):
+    """Replace every ``.py`` file under ``function_dir`` with its bytecode.
+
+    :raises RuntimeError: A source file could not be compiled.
+    """
+    if not compileall.compile_dir(function_dir, quiet=1, legacy=True):
+        raise RuntimeError(f'Unable to compile {function_dir}')
+
+    for dir_path, _, file_names in os.walk(function_dir):
+        for name in file_names:
+            if name.endswith('.py'):
+                os.remove(os.path.join(dir_path, name))
+
+
+def build_function(source_dir, function_dir, compile_sources=True):
+    # copytree follows symlinks so shared modules are copied into the build
+    shutil.copytree(source_dir, function_dir,
+                    ignore=shutil.ignore_patterns('__pycache__', '*.pyc'))
+
+    requirements = os.path.join(function_dir, 'requirements.txt')
+    if os.path.isfile(requirements):
+        subprocess.check_call([
+            sys.executable, '-m', 'pip', 'install', '--quiet',
+            '--requirement', requirements, '--target', function_dir
+        ])
+
+    services = used_services(source_dir)
+    removed = strip_package_files(function_dir)
+    removed += strip_service_models(function_dir, services)
+
+    if compile_sources:
+        compile_sourceless(function_dir)
+
+    size = directory_size(function_dir)
+    print(f"  {os.path.basename(function_dir)}: {size / 1024:.1f} KiB "
+          f"({removed / 1024:.1f} KiB stripped, services: "
+          f"{', '.join(sorted(services)) or 'none'})")
+
+
+def build_component(name, output_dir, compile_sources=True):
+    print(f'{name}:')
+    build_dir = os.path.join(output_dir, name)
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+
+    os.makedirs(build_dir)
+    shutil.copy(os.path.join(ROOT, name, 'template.yaml'), build_dir)
+
+    functions_dir = os.path.join(ROOT, name, 'src', 'functions')
+    for function in sorted(os.listdir(functions_dir)):
+        build_function(
+            os.path.join(functions_dir, function),
+            os.path.join(build_dir, 'src', 'functions', function),
+            compile_sources
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build startup-optimized deployment artifacts.')
+    parser.add_argument('components', nargs='*',
+                        help='Components to build (default: all).')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'build'),
+                        help='The build directory.')
+    parser.add_argument('--no-compile', action='store_true',
+                        help='Do not precompile sources to bytecode.')
+    args = parser.parse_args()
+
+    if not args.no_compile and sys.version_info[:2] != (3, 6):
+        print(f'Warning: bytecode compiled with Python '
+              f'{sys.version_info[0]}.{sys.version_info[1]} will be ignored '
+              'by the python3.6 runtime', file=sys.stderr)
+
+    for name in components(args.components):
+        build_component(name, args.output, not args.no_compile)
+
+
+if __name__ == '__main__':
+    main()
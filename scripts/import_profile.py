@@ -0,0 +1,225 @@
+"""Report the import time of each component's function modules.
+
+Each module is imported in a fresh interpreter with ``-X importtime``
+(Python 3.7+) and placeholder values for the environment variables in the
+component's template, which is what a Lambda cold start pays before the
+handler is called. Run it before and after a change to track the cost::
+
+    python scripts/import_profile.py [--top 5] [--json]
+
+Modules the handler imports inside its functions (e.g. boto3 or
+``botocore.vendored.requests``) are not paid for at import time, but still
+on the first invocation that uses them. They are found in the handler's
+source and imported after it in the same interpreter, so the report shows
+both the import time of the module and the cold start total.
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV_PATTERN = re.compile(r'^\s{10}(\w+):', re.MULTILINE)
+IMPORT_TIME_PATTERN = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def function_modules():
+    """Yield the component, function directory and module name of every
+    Lambda handler module.
+    """
+    for component in sorted(os.listdir(ROOT)):
+        template = os.path.join(ROOT, component, 'template.yaml')
+        if not os.path.isfile(template):
+            continue
+
+        functions_dir = os.path.join(ROOT, component, 'src', 'functions')
+        for function in sorted(os.listdir(functions_dir)):
+            function_dir = os.path.join(functions_dir, function)
+            if os.path.isfile(os.path.join(function_dir, f'{function}.py')):
+                yield component, function_dir, function
+
+
+def lazy_imports(path, seen=None):
+    """Return the import statements a module runs inside its functions,
+    including those of the local modules it imports (e.g. the shared
+    ``aws_clients``).
+
+    :param str path: The path of the module.
+
+    :rtype: list
+    """
+    seen = seen if seen is not None else set()
+    seen.add(os.path.realpath(path))
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    statements = list()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            names = [node.module]
+        else:
+            continue
+
+        for name in names:
+            local = os.path.join(os.path.dirname(path), f'{name}.py')
+            if os.path.isfile(local) and \
+                    os.path.realpath(local) not in seen:
+                statements.extend(lazy_imports(local, seen))
+
+    for function in ast.walk(tree):
+        if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+
+        for node in ast.walk(function):
+            if isinstance(node, ast.Import):
+                statement = 'import ' + ', '.join(
+                    alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                statement = f'from {node.module} import ' + ', '.join(
+                    alias.name for alias in node.names)
+            else:
+                continue
+
+            statements.append(statement)
+
+    # Keep the first occurrence of each statement
+    return list(dict.fromkeys(statements))
+
+
+def template_environment(component):
+    """Return placeholder values for the environment variables defined in a
+    component's template and those set by Lambda.
+    """
+    with open(os.path.join(ROOT, component, 'template.yaml')) as f:
+        template = f.read()
+
+    # Lambda sets the region, which clients created at import time need
+    env = {'AWS_DEFAULT_REGION': os.getenv('AWS_DEFAULT_REGION', 'us-east-1')}
+    if 'Variables:' not in template:
+        return env
+
+    variables = template.split('Variables:', 1)[1].split('Policies:', 1)[0]
+    # A numeric placeholder is also valid for settings parsed as numbers
+    env.update({name: '1' for name in ENV_PATTERN.findall(variables)})
+    return env
+
+
+def profile_import(module, cwd, env, statements=()):
+    """Import ``module`` in a new interpreter, followed by any other import
+    ``statements``, and return the parsed ``-X importtime`` output.
+
+    :returns: The import time of the module and the total of every import
+        in microseconds, and the cumulative time of each module imported
+        directly by the module or the statements.
+    :rtype: tuple
+    """
+    code = '; '.join([f'import {module}'] + list(statements))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=cwd,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1', **env),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    entries = list()
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            entries.append((int(match.group(2)), len(match.group(3)),
+                            match.group(4)))
+
+    # Modules are reported after the modules they import, and the modules
+    # imported by the statements themselves are at the top level
+    index = max(i for i, entry in enumerate(entries) if entry[2] == module)
+    total, depth, _ = entries[index]
+    children = [(name, us) for us, level, name in entries[index + 1:]
+                if level == depth]
+    for us, level, name in reversed(entries[:index]):
+        if level < depth + 2:
+            break
+        if level == depth + 2:
+            children.append((name, us))
+
+    cold_start = sum(us for us, level, _ in entries if level == depth)
+    return total, cold_start, sorted(children, key=lambda child: -child[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Report the import time of each component.')
+    parser.add_argument('--top', type=int, default=5,
+                        help='The number of slowest imports to list.')
+    parser.add_argument('--json', action='store_true',
+                        help='Output the report as JSON.')
+    args = parser.parse_args()
+
+    if sys.version_info < (3, 7):
+        parser.error('-X importtime requires Python 3.7 or later')
+
+    report = list()
+    for component, cwd, module in function_modules():
+        statements = lazy_imports(os.path.join(cwd, f'{module}.py'))
+        env = template_environment(component)
+        entry = {'component': component, 'module': module,
+                 'lazy_imports': statements}
+        try:
+            total, cold_start, children = profile_import(
+                module, cwd, env, statements)
+        except RuntimeError as err:
+            # Still report the module itself if a lazy import failed
+            try:
+                total, _, children = profile_import(module, cwd, env)
+            except RuntimeError as module_err:
+                entry['error'] = str(module_err)
+                report.append(entry)
+                continue
+            cold_start = None
+            entry['error'] = str(err)
+
+        entry['import_ms'] = round(total / 1000, 2)
+        entry['cold_start_ms'] = None if cold_start is None \
+            else round(cold_start / 1000, 2)
+        entry['slowest'] = [
+            {'module': name, 'import_ms': round(us / 1000, 2)}
+            for name, us in children[:args.top]
+        ]
+        report.append(entry)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print('| Component | Module | Import (ms) | Cold start (ms) | '
+          'Slowest imports (ms) |')
+    print('|---|---|---:|---:|---|')
+    for entry in report:
+        if 'import_ms' not in entry:
+            print(f"| {entry['component']} | {entry['module']} | - | - | "
+                  f"{entry['error']} |")
+            continue
+
+        slowest = ', '.join(
+            f"{child['module']} {child['import_ms']}"
+            for child in entry['slowest']
+        )
+        if entry['cold_start_ms'] is None:
+            slowest += f" ({entry['error']})"
+        cold_start = '-' if entry['cold_start_ms'] is None \
+            else entry['cold_start_ms']
+        print(f"| {entry['component']} | {entry['module']} | "
+              f"{entry['import_ms']} | {cold_start} | {slowest} |")
+
+
+if __name__ == '__main__':
+    main()
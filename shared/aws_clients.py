@@ -0,0 +1,21 @@
+"""Cached boto3 clients for the Lambda functions.
+
+boto3 is imported when the first client is created rather than when the
+function module is imported, so invocations that never call AWS do not pay
+for it. Clients are kept for the warm invocations of the function.
+
+This module lives in ``shared/`` and is linked into the function directories
+that use it.
+"""
+_clients = dict()
+
+
+def aws_client(service_name):
+    """Return the boto3 client for a service, creating it on first use.
+
+    :param str service_name: The AWS service name, e.g. ``s3``.
+    """
+    if service_name not in _clients:
+        import boto3
+        _clients[service_name] = boto3.client(service_name)
+    return _clients[service_name]
@@ -0,0 +1,212 @@
+"""Validation and normalization of Jamf Pro webhook events.
+
+The Webhook Receiver validates every inbound webhook once with
+:func:`validate_webhook` and publishes the normalized message. Subscribers
+rebuild the event with :meth:`WebhookEvent.from_message` without validating
+it again.
+
+This module lives in ``shared/`` and is linked into the function directories
+that use it.
+"""
+from collections import namedtuple
+
+_none = type(None)
+_str = (str,)
+_int = (int,)
+_bool = (bool,)
+_list = (list,)
+_opt_str = (str, _none)
+_opt_int = (int, _none)
+
+_device_fields = {
+    'jssID': _int,
+    'serialNumber': _str,
+    'udid': _str,
+    'deviceName': _opt_str,
+    'username': _opt_str
+}
+
+_jss_fields = {
+    'jssUrl': _str,
+    'isClusterMaster': _bool
+}
+
+_smart_group_fields = {
+    'jssid': _int,
+    'name': _str,
+    'smartGroup': _bool,
+    'groupAddedDevicesIds': _list,
+    'groupRemovedDevicesIds': _list
+}
+
+# Computer events sent from a check-in or inventory report the computer as a
+# nested object
+_computer_fields = {
+    'computer': _device_fields
+}
+
+# Required ``event`` fields and their allowed types for each webhook event.
+# A field given a dictionary of fields must be an object with those fields.
+# Events listed without fields only require ``event`` to be an object.
+EVENT_SCHEMAS = {
+    'ComputerAdded': _device_fields,
+    'ComputerCheckIn': _computer_fields,
+    'ComputerInventoryCompleted': _computer_fields,
+    'ComputerPolicyFinished': {},
+    'ComputerPushCapabilityChanged': {},
+    'DeviceAddedToDEP': {},
+    'JSSShutdown': _jss_fields,
+    'JSSStartup': _jss_fields,
+    'MobileDeviceCheckIn': _device_fields,
+    'MobileDeviceCommandCompleted': {},
+    'MobileDeviceEnrolled': _device_fields,
+    'MobileDevicePushSent': {},
+    'MobileDeviceUnEnrolled': _device_fields,
+    'PatchSoftwareTitleUpdated': {
+        'jssID': _int,
+        'name': _str,
+        'latestVersion': _str,
+        'reportUrl': _str
+    },
+    'PushSent': {},
+    'RestAPIOperation': {
+        'authorizedUsername': _str,
+        'objectID': _opt_int,
+        'objectName': _opt_str,
+        'objectTypeName': _str,
+        'operationSuccessful': _bool,
+        'restAPIOperationType': _str
+    },
+    'SCEPChallenge': {},
+    'SmartGroupComputerMembershipChange': _smart_group_fields,
+    'SmartGroupMobileDeviceMembershipChange': _smart_group_fields
+}
+
+
+class InvalidWebhook(ValueError):
+    """The webhook payload does not match the schema of its event type."""
+
+
+def _compile(fields, path=''):
+    """Return a function that checks the ``event`` data of a webhook against
+    ``fields`` and returns the name of the first invalid field, or ``None``.
+    Nested fields are named by their path, e.g. ``computer.jssID``.
+    """
+    checks = tuple(
+        (name, types if not isinstance(types, dict) else
+         _compile(types, f'{path}{name}.'))
+        for name, types in fields.items()
+    )
+
+    def check(data):
+        for name, types in checks:
+            value = data.get(name)
+            if callable(types):
+                if type(value) is not dict:
+                    return path + name
+                invalid_field = types(value)
+                if invalid_field:
+                    return invalid_field
+            elif type(value) not in types:
+                return path + name
+        return None
+
+    return check
+
+
+_validators = {
+    event_type: _compile(fields)
+    for event_type, fields in EVENT_SCHEMAS.items()
+}
+
+
+class WebhookEvent(namedtuple('WebhookEvent', [
+        'event_type', 'webhook_id', 'webhook_name', 'event_timestamp',
+        'data'])):
+    """A validated Jamf Pro webhook event.
+
+    :param str event_type: The ``webhookEvent`` type.
+    :param int webhook_id: The ID of the webhook in Jamf Pro.
+    :param str webhook_name: The name of the webhook in Jamf Pro.
+    :param int event_timestamp: The time of the event in milliseconds, if
+        sent by Jamf Pro.
+    :param dict data: The ``event`` data.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_message(cls, message):
+        """Rebuild an event from a message published by the Webhook Receiver.
+
+        The message is not validated again.
+
+        :param dict message: The normalized webhook message.
+
+        :raises KeyError: The message is not a webhook event.
+
+        :rtype: WebhookEvent
+        """
+        webhook = message['webhook']
+        return cls(webhook['webhookEvent'], webhook.get('id'),
+                   webhook.get('name'), webhook.get('eventTimestamp'),
+                   message['event'])
+
+    def to_message(self):
+        """Return the normalized message to publish for the event. It keeps
+        the structure of the webhook sent by Jamf Pro.
+
+        :rtype: dict
+        """
+        webhook = {
+            'id': self.webhook_id,
+            'name': self.webhook_name,
+            'webhookEvent': self.event_type
+        }
+        if self.event_timestamp is not None:
+            webhook['eventTimestamp'] = self.event_timestamp
+
+        return {'webhook': webhook, 'event': self.data}
+
+
+def validate_webhook(payload):
+    """Validate a decoded Jamf Pro webhook.
+
+    Unknown event types are accepted if the ``webhook`` and ``event`` objects
+    are well formed.
+
+    :param dict payload: Jamf Pro webhook JSON as dictionary.
+
+    :raises InvalidWebhook: The payload is malformed.
+
+    :rtype: WebhookEvent
+    """
+    if type(payload) is not dict:
+        raise InvalidWebhook('Webhook payload must be an object')
+
+    webhook = payload.get('webhook')
+    data = payload.get('event')
+    if type(webhook) is not dict or type(data) is not dict:
+        raise InvalidWebhook("Webhook payload requires 'webhook' and 'event' "
+                             "objects")
+
+    event_type = webhook.get('webhookEvent')
+    if type(event_type) is not str:
+        raise InvalidWebhook("Webhook payload requires a 'webhookEvent'")
+
+    webhook_id = webhook.get('id')
+    webhook_name = webhook.get('name')
+    event_timestamp = webhook.get('eventTimestamp')
+    if type(webhook_id) not in _opt_int or \
+            type(webhook_name) not in _opt_str or \
+            type(event_timestamp) not in _opt_int:
+        raise InvalidWebhook("Invalid 'webhook' object")
+
+    validator = _validators.get(event_type)
+    if validator:
+        invalid_field = validator(data)
+        if invalid_field:
+            raise InvalidWebhook(
+                f"Invalid or missing '{invalid_field}' for {event_type}")
+
+    return WebhookEvent(event_type, webhook_id, webhook_name, event_timestamp,
+                        data)